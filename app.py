@@ -5,11 +5,13 @@ Handles image uploads and caption generation
 
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
-from PIL import Image
-import io
+from PIL import Image, ImageOps
+from cachetools import LRUCache
+import hashlib
 import os
 import logging
-from model_loader import generate_caption, generate_detailed_caption
+import threading
+from model_loader import generate_caption, generate_detailed_caption, warmup_model
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +24,16 @@ CORS(app)
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+MAX_NUM_BEAMS = 8
+
+# Image content digest -> caption cache; Flask serves requests on many threads
+caption_cache = LRUCache(maxsize=1024)
+caption_cache_lock = threading.Lock()
+
+# Load and warm up the model at import time so the first request does not
+# pay for it. Under `gunicorn --preload` this runs once in the master and
+# forked workers share the weights copy-on-write.
+warmup_model()
 
 
 def allowed_file(filename):
@@ -62,12 +74,32 @@ def upload_image():
         
         # Read and validate image
         try:
-            image_bytes = file.read()
-            image = Image.open(io.BytesIO(image_bytes))
+            # Decode straight from the upload stream instead of copying it
+            image = Image.open(file.stream)
+            
+            # Let libjpeg decode at a reduced DCT scale; BLIP resizes to 384 anyway
+            image.draft('RGB', (384, 384))
+            
+            # Honor EXIF rotation; most uploads have none, so skip the transpose copy
+            if image.getexif().get(0x0112, 1) != 1:
+                image = ImageOps.exif_transpose(image)
             
             # Convert to RGB if necessary
             if image.mode != 'RGB':
                 image = image.convert('RGB')
+            
+            # Cheap downscale first; the model's own 384x384 resize then works
+            # on a small image instead of a multi-megapixel photo. Each axis is
+            # capped separately: the model squashes to a square anyway, and
+            # keeping the aspect ratio would push the short side below 384
+            width, height = image.size
+            if width > 512 or height > 512:
+                image = image.resize(
+                    (min(width, 512), min(height, 512)), Image.Resampling.BILINEAR
+                )
+            
+            # Exact pixel digest: only re-uploads of the same image hit the cache
+            image_hash = hashlib.blake2b(image.tobytes()).hexdigest()
                 
         except Exception as e:
             logger.error(f"Error reading image: {str(e)}")
@@ -76,12 +108,25 @@ def upload_image():
         # Get caption type from request (default or detailed)
         caption_type = request.form.get('type', 'default')
         
+        # Greedy decoding by default; beam search is opt-in for quality
+        num_beams = request.form.get('num_beams', 1, type=int)
+        if not 1 <= num_beams <= MAX_NUM_BEAMS:
+            return jsonify({'error': f'num_beams must be between 1 and {MAX_NUM_BEAMS}'}), 400
+        
+        cache_key = (image_hash, caption_type, num_beams)
+        with caption_cache_lock:
+            caption = caption_cache.get(cache_key)
+        
         # Generate caption
         try:
-            if caption_type == 'detailed':
-                caption = generate_detailed_caption(image)
-            else:
-                caption = generate_caption(image)
+            if caption is None:
+                if caption_type == 'detailed':
+                    caption = generate_detailed_caption(image, num_beams=num_beams)
+                else:
+                    caption = generate_caption(image, num_beams=num_beams)
+                
+                with caption_cache_lock:
+                    caption_cache[cache_key] = caption
                 
             logger.info(f"Successfully generated caption for {file.filename}")
             
@@ -133,5 +178,6 @@ if __name__ == '__main__':
     logger.info("Starting Image Captioning Server...")
     logger.info("Server will be available at http://localhost:5000")
     
-    # Run the app
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; use gunicorn (see gunicorn.conf.py) in production.
+    # Debug mode's reloader and debugger slow down inference
+    app.run(debug=False, threaded=True, host='0.0.0.0', port=5000)
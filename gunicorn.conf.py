@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the Image Captioning server
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+# Probe for a GPU through NVML so the master never initializes CUDA,
+# which would make it unusable in forked workers
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+
+import torch
+
+bind = "0.0.0.0:5000"
+
+# Model loading and warmup can take minutes on first run
+timeout = 600
+
+if torch.cuda.is_available():
+    # One process owns the CUDA context; threads feed the batch worker
+    workers = 1
+    threads = 8
+    preload_app = False
+else:
+    # Load the model once in the master; workers share it copy-on-write
+    workers = os.cpu_count() or 1
+    threads = 1
+    preload_app = True
+    
+    # Single-threaded workers never see a second caller to batch with, so
+    # don't hold each caption back waiting for one (read when app is loaded)
+    os.environ.setdefault("CAPTION_BATCH_WAIT_MS", "0")
+
+
+def post_fork(server, worker):
+    """Split the CPU cores between workers instead of oversubscribing them"""
+    # server.cfg reflects command-line overrides such as -w
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // server.cfg.workers))